@@ -1,21 +1,30 @@
 #!/usr/bin/env python3
+import errno
 import fcntl
+import functools
 import hashlib
 import json
 import os
 import re
-import secrets
-import shutil
 import sys
-import tempfile
 from contextlib import contextmanager
-from dataclasses import dataclass
-from typing import Any
+from dataclasses import asdict, dataclass
+from typing import Any, Iterator
 
-import tomllib
+try:
+    import orjson  # type: ignore[import-not-found]
+except ImportError:
+    orjson = None  # type: ignore[assignment]
 
-START_MARKER_RE = re.compile(r"^#\s*nb\.start(.*?)$")
-END_MARKER_RE = re.compile(r"^#\s*nb\.end\s*$")
+NB_PATH = os.path.expanduser("~/.nb")
+REQUIRED_CONFIG_KEYS = ("notebooks_path", "jupyter_path", "ipython_path")
+CACHED_FILE_SUFFIXES = (".py",)
+
+MARKER_RE = re.compile(r"^#[^\S\n]*nb\.(?:(start)[^\n]*|end[^\S\n]*)$", re.MULTILINE)
+# IPython magics, shell escapes, help and autocall syntax that only nbconvert can translate
+IPYTHON_SYNTAX_RE = re.compile(
+    r"^\s*[%!?/,;]|^[\w.,\s]+=\s*[%!]|^\s*[\w.]+\?{1,2}\s*$", re.MULTILINE
+)
 
 
 @dataclass(frozen=True)
@@ -24,148 +33,338 @@ class Config:
     jupyter_path: str
     ipython_path: str
 
-    cache_path: str = os.path.expanduser("~/.nb/cache/")
-    lock_file_path: str = os.path.expanduser("~/.nb/lock")
-    interpreters_mapping_path: str = os.path.expanduser("~/.nb/interpreters.json")
+    cache_path: str = os.path.join(NB_PATH, "cache", "")
+    lock_file_path: str = os.path.join(NB_PATH, "lock")
+    interpreters_mapping_path: str = os.path.join(NB_PATH, "interpreters.json")
 
     @classmethod
     def from_dict(cls, config_dict: dict[str, Any]) -> "Config":
         # Check if required paths are provided
-        for key in ["notebooks_path", "jupyter_path", "ipython_path"]:
+        for key in REQUIRED_CONFIG_KEYS:
             if key not in config_dict:
                 raise ValueError(f"Required config key '{key}' not found")
 
         # Create Config with expanded paths
         return cls(
-            notebooks_path=os.path.expanduser(config_dict["notebooks_path"]),
-            jupyter_path=os.path.expanduser(config_dict["jupyter_path"]),
-            ipython_path=os.path.expanduser(config_dict["ipython_path"]),
+            **{
+                key: os.path.expanduser(config_dict[key])
+                for key in REQUIRED_CONFIG_KEYS
+            }
         )
 
 
+@functools.lru_cache(maxsize=8)
+def _load_config(path: str, mtime_ns: int) -> Config:
+    """Parse configuration file, cached until the file is modified"""
+    import tomllib
+
+    with open(path, "rb") as f:
+        config_dict = tomllib.load(f)
+    return Config.from_dict(config_dict.get("default", {}))
+
+
 def load_config(path: str) -> Config:
     try:
-        with open(path, "rb") as f:
-            config_dict = tomllib.load(f)
-            return Config.from_dict(config_dict.get("default", {}))
+        return _load_config(path, os.stat(path).st_mtime_ns)
     except Exception as e:
         print(f"Error loading configuration: {e}")
         sys.exit(1)
 
 
+# Lock files stay open for the rest of the process once used
+_lock_fds: dict[str, int] = {}
+
+# Exclusive lock files older than this are left over from a crashed process.
+# Taking over a stale lock is racy: when two waiters find it stale, one may remove
+# the fresh lock the other just created between its check and unlink, so mutual
+# exclusion is not guaranteed right after a takeover
+STALE_LOCK_SECONDS = 10
+
+
+def _remove_lock_file(path: str, stat: os.stat_result) -> None:
+    """Remove lock file if it is still the file described by stat"""
+    try:
+        current_stat = os.stat(path)
+        # Inode numbers can be reused, a fresh lock also has a newer mtime
+        if (current_stat.st_ino, current_stat.st_mtime_ns) == (
+            stat.st_ino,
+            stat.st_mtime_ns,
+        ):
+            os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
 @contextmanager
-def lock_file(path: str):
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "w") as lock_file:
+def exclusive_lock_file(path: str):
+    """Lock by atomically creating a file, for filesystems without flock support"""
+    import time
+
+    delay = 0.001
+    while True:
         try:
-            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666)
+            break
+        except FileExistsError:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if time.time() - stat.st_mtime > STALE_LOCK_SECONDS:
+                _remove_lock_file(path, stat)
+                continue
+
+            time.sleep(delay)
+            delay = min(delay * 2, 0.1)
+
+    try:
+        yield
+    finally:
+        # Lock may have been taken over as stale, don't remove the new owner's lock
+        _remove_lock_file(path, os.fstat(fd))
+        os.close(fd)
+
+
+@contextmanager
+def lock_file(path: str):
+    if path not in _lock_fds:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _lock_fds[path] = os.open(path, os.O_CREAT | os.O_RDWR, 0o666)
+
+    fd = _lock_fds[path]
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        flock_supported = True
+    except OSError as e:
+        # Some network filesystems don't support flock
+        if e.errno not in (errno.ENOLCK, errno.EOPNOTSUPP):
+            raise
+        flock_supported = False
+
+    if not flock_supported:
+        with exclusive_lock_file(f"{path}.excl"):
             yield
-        finally:
-            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+        return
+
+    try:
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+# Last parsed interpreter mapping per path, with inode, modification time and size
+# it was read at, inode changes on every atomic replace even within one mtime tick
+_mappings_cache: dict[str, tuple[tuple[int, int, int], dict[str, str]]] = {}
+
+
+def _mapping_stamp(stat: os.stat_result) -> tuple[int, int, int]:
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def read_interpreters_mapping(path: str) -> dict[str, str]:
+    """Read interpreters mapping, reusing the parsed mapping while file is unchanged"""
+    with open(path, "rb") as f:
+        stamp = _mapping_stamp(os.fstat(f.fileno()))
+        cached = _mappings_cache.get(path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+
+        mapping = orjson.loads(f.read()) if orjson else json.load(f)
+
+    _mappings_cache[path] = (stamp, mapping)
+    return mapping
 
 
 def get_interpreter_path(config: Config, name: str) -> str:
     """Get interpreter path for notebook, with fallback to config"""
-    with lock_file(config.lock_file_path):
-        if not os.path.exists(config.interpreters_mapping_path):
-            return config.ipython_path
+    # Mapping is only ever replaced atomically, so reading doesn't need the lock
+    try:
+        mapping = read_interpreters_mapping(config.interpreters_mapping_path)
+    except FileNotFoundError:
+        return config.ipython_path
 
-        with open(config.interpreters_mapping_path, "r") as f:
-            return json.load(f).get(name, config.ipython_path)
+    return mapping.get(name, config.ipython_path)
 
 
-def set_interpreter_path(config: Config, name: str, path: str) -> None:
-    """Set interpreter path for notebook"""
+@contextmanager
+def interpreters_mapping(config: Config) -> Iterator[dict[str, str]]:
+    """Lock interpreters mapping for updates and write it once on exit"""
     with lock_file(config.lock_file_path):
-        mapping = {}
+        try:
+            # Copy so cached mapping stays intact if writing fails
+            mapping = dict(read_interpreters_mapping(config.interpreters_mapping_path))
+        except FileNotFoundError:
+            mapping = {}
+
+        yield mapping
+
+        # Flush to disk before renaming so a crash can't leave an empty mapping
+        temp_path = f"{config.interpreters_mapping_path}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(orjson.dumps(mapping) if orjson else json.dumps(mapping).encode())
+            f.flush()
+            os.fsync(f.fileno())
+            stamp = _mapping_stamp(os.fstat(f.fileno()))
+        os.replace(temp_path, config.interpreters_mapping_path)
+
+        # Flush directory as well so the rename itself survives a crash
+        dir_fd = os.open(os.path.dirname(config.interpreters_mapping_path), os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
 
-        if os.path.exists(config.interpreters_mapping_path):
-            with open(config.interpreters_mapping_path, "r") as f:
-                mapping = json.load(f)
+        _mappings_cache[config.interpreters_mapping_path] = (stamp, mapping)
 
-        mapping[name] = path
 
-        with open(config.interpreters_mapping_path, "w") as f:
-            json.dump(mapping, f)
+def set_interpreter_path(config: Config, name: str, path: str) -> None:
+    """Set interpreter path for notebook"""
+    with interpreters_mapping(config) as mapping:
+        mapping[name] = path
 
 
 def parse_file(content: str) -> tuple[str, dict[str, Any]]:
-    start_found, end_found = False, False
-    parsing_toml = False
+    # Most notebooks have no markers, skip the regex scan for them
+    if "nb.start" not in content and "nb.end" not in content:
+        return content.strip(), {}
 
-    script_lines = []
-    toml_lines = []
+    start_match, end_match = None, None
 
-    for line in content.split("\n"):
-        start_match = START_MARKER_RE.match(line)
-        end_match = END_MARKER_RE.match(line)
-
-        if start_found and not end_found:
-            if start_match:
+    for match in MARKER_RE.finditer(content):
+        if match.group(1):
+            if start_match is None:
+                start_match = match
+            elif end_match is None:
                 raise ValueError("Nested start markers are not supported")
-            elif end_match:
-                end_found = True
-            elif parsing_toml:
-                if line.startswith("#"):
-                    # Collect TOML lines (remove leading # and space)
-                    toml_content = line[1:].strip()
-                    # Skip empty lines
-                    if toml_content:
-                        toml_lines.append(toml_content)
-                else:
-                    # If we encounter a non-comment, TOML section is over
-                    parsing_toml = False
-                    script_lines.append(line)
             else:
-                script_lines.append(line)
-        elif start_found and end_found:
-            if start_match:
                 raise ValueError("Start marker found after end marker")
-            elif end_match:
-                raise ValueError("Nested end markers are not supported")
+        elif start_match is None:
+            raise ValueError("End marker found before start marker")
+        elif end_match is None:
+            end_match = match
         else:
-            if start_match:
-                start_found = True
-                # Start collecting TOML right after the start marker
-                parsing_toml = True
-            elif end_match:
-                raise ValueError("End marker found before start marker")
+            raise ValueError("Nested end markers are not supported")
 
     # If no markers found, use the entire notebook
-    if not start_found:
-        script_lines = content.split("\n")
+    if start_match is None:
+        return content.strip(), {}
+
+    section_start = min(start_match.end() + 1, len(content))
+    section_end = end_match.start() if end_match else len(content)
+
+    # Collect TOML from comment lines right after the start marker
+    toml_end = section_start
+    while content.startswith("#", toml_end, section_end):
+        line_end = content.find("\n", toml_end, section_end)
+        toml_end = section_end if line_end == -1 else line_end + 1
+
+    script_content = content[toml_end:section_end].strip()
+    toml_lines = [
+        line[1:].strip()
+        for line in content[section_start:toml_end].splitlines()
+        if line[1:].strip()
+    ]
+
+    if not toml_lines:
+        return script_content, {}
+
+    import tomllib
 
     try:
-        config_data = tomllib.loads("\n".join(toml_lines)) if toml_lines else {}
+        config_data = tomllib.loads("\n".join(toml_lines))
     except tomllib.TOMLDecodeError:
         raise ValueError(
             "Invalid TOML config after start marker, make sure to add empty line after start marker and config lines"
         )
 
-    return "\n".join(script_lines).strip(), config_data
+    return script_content, config_data
+
+
+def read_file(path: str) -> str:
+    """Read UTF-8 text file"""
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def read_notebook_source(notebook_path: str) -> str | None:
+    """Read code cells of a plain Python notebook, None if nbconvert is needed"""
+    try:
+        notebook = json.loads(read_file(notebook_path))
+    except (OSError, ValueError):
+        return None
+
+    # Anything unexpected is left to nbconvert
+    if not isinstance(notebook, dict) or not isinstance(notebook.get("cells"), list):
+        return None
+
+    metadata = notebook.get("metadata", {})
+    if not isinstance(metadata, dict):
+        return None
+    language_info = metadata.get("language_info", {})
+    if not isinstance(language_info, dict):
+        return None
+    if language_info.get("name") not in (None, "python"):
+        return None
+
+    sources = []
+    for cell in notebook["cells"]:
+        if not isinstance(cell, dict):
+            return None
+        if cell.get("cell_type") != "code":
+            continue
+
+        source = cell.get("source", "")
+        if isinstance(source, list) and all(isinstance(line, str) for line in source):
+            source = "".join(source)
+        if not isinstance(source, str):
+            return None
+
+        if IPYTHON_SYNTAX_RE.search(source):
+            return None
+
+        sources.append(source)
+
+    return "\n\n".join(sources)
+
+
+def run_nbconvert(config: Config, notebook_path: str) -> str | None:
+    """Convert notebook to script with nbconvert, None if conversion failed"""
+    import subprocess
+
+    argv = [config.jupyter_path, "nbconvert", "--log-level", "ERROR"]
+    argv += ["--to", "script", "--stdout", notebook_path]
+
+    # Read converted script from the pipe, without a shell or a temporary file
+    try:
+        result = subprocess.run(argv, stdout=subprocess.PIPE)
+    except OSError:
+        return None
+
+    if result.returncode != 0:
+        return None
+
+    return result.stdout.decode("utf-8")
 
 
 def transform_notebook(
     config: Config, name: str, notebook_path: str, script_path: str
 ) -> bool:
     """Transform notebook to script, extracting the section between nb.start and nb.end"""
-    with tempfile.TemporaryDirectory() as temp_dir:
-        temp_path = os.path.join(temp_dir, secrets.token_hex(8))
-        os.system(
-            f"{config.jupyter_path} nbconvert --log-level ERROR --to script {notebook_path} --output {temp_path}"
-        )
+    import tempfile
 
-        temp_script_path = f"{temp_path}.py"
-        if not os.path.exists(temp_script_path):
+    content = read_notebook_source(notebook_path)
+    if content is None:
+        content = run_nbconvert(config, notebook_path)
+        if content is None:
             return False
 
-        with open(temp_script_path, "r") as f:
-            content = f.read()
-
     script_content, script_config = parse_file(content)
 
-    with open(script_path, "w") as f:
+    # Replace instead of writing in place, cached files may be hard links to sources
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(script_path), suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
         f.write(script_content)
+    os.replace(temp_path, script_path)
 
     if "ipython_path" in script_config:
         set_interpreter_path(config, name, script_config["ipython_path"])
@@ -173,73 +372,220 @@ def transform_notebook(
     return True
 
 
-def sync_python_files(from_path: str, to_path: str) -> None:
-    """Cache only modified Python files in notebooks folder and remove outdated cached files"""
+@functools.lru_cache(maxsize=None)
+def _mtime_ns(path: str) -> int:
+    """Get file modification time in nanoseconds, 0 if file doesn't exist (cached per process)"""
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+def _walk(path: str, suffix: str | tuple[str, ...] = "") -> Iterator[os.DirEntry]:
+    """Recursively yield file entries with given suffix, filtering by name before any stat"""
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _walk(entry.path, suffix)
+            elif entry.name.endswith(suffix) and entry.is_file():
+                yield entry
+
+
+def _sync_python_file(entry: os.DirEntry, dest_path: str) -> None:
+    """Link or copy file to cache if the cached copy is missing or outdated"""
+    import shutil
+
+    # Check if the destination file exists and is up-to-date
+    src_stat = entry.stat()
+    try:
+        if src_stat.st_mtime_ns <= os.stat(dest_path).st_mtime_ns:
+            return
+    except FileNotFoundError:
+        pass
+
+    # Link under a unique name and replace, so concurrent runs syncing
+    # the same cache never see a missing or half-copied file
+    temp_path = f"{dest_path}.{os.getpid()}.tmp"
+    try:
+        os.remove(temp_path)
+    except FileNotFoundError:
+        pass
+
+    # Hard link shares the file without copying data, copy across filesystems
+    try:
+        os.link(entry.path, temp_path)
+    except OSError:
+        # copyfile uses sendfile on Linux, only mtime is needed from copy2 metadata
+        shutil.copyfile(entry.path, temp_path)
+        os.utime(temp_path, ns=(src_stat.st_atime_ns, src_stat.st_mtime_ns))
+    os.replace(temp_path, dest_path)
+
+
+def sync_python_files(
+    from_path: str, to_path: str, script_path: str | None = None
+) -> None:
+    """Cache only modified Python files in notebooks folder and remove outdated cached files,
+    leaving the notebook script alone"""
+    from concurrent.futures import ThreadPoolExecutor
+
     source_files = set()
+    dest_dirs = {to_path}
 
     os.makedirs(to_path, exist_ok=True)
 
-    for root, _, files in os.walk(from_path):
-        for file in files:
-            if not file.endswith(".py"):
+    # Copying is I/O bound, so threads overlap it with the walk and each other
+    max_workers = min(32, (os.cpu_count() or 1) * 4)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = []
+        for entry in _walk(from_path, CACHED_FILE_SUFFIXES):
+            dest_path = os.path.join(to_path, os.path.relpath(entry.path, from_path))
+            if dest_path == script_path:
                 continue
+            source_files.add(dest_path)
+            # Create each destination directory once, before its files are linked
+            dest_dir = os.path.dirname(dest_path)
+            if dest_dir not in dest_dirs:
+                os.makedirs(dest_dir, exist_ok=True)
+                dest_dirs.add(dest_dir)
+            futures.append(executor.submit(_sync_python_file, entry, dest_path))
+
+        for future in futures:
+            future.result()
+
+    # If the same files were synced last time, the cache has nothing to remove
+    synced_files = sorted(source_files)
+    stamp_path = to_path.rstrip(os.sep) + ".stamp"
+    try:
+        with open(stamp_path, "r") as f:
+            if json.load(f) == synced_files:
+                return
+    except (FileNotFoundError, ValueError):
+        pass
 
-            src_path = os.path.join(root, file)
-            dest_path = os.path.join(to_path, os.path.relpath(src_path, from_path))
+    # Remove cached files that are no longer in the source folder,
+    # leaving temporary files of concurrent runs alone
+    if script_path is not None:
+        source_files.add(script_path)
+    for entry in _walk(to_path):
+        if entry.path not in source_files and not entry.name.endswith(".tmp"):
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+    with open(stamp_path, "w") as f:
+        json.dump(synced_files, f)
 
-            source_files.add(dest_path)
 
-            # Check if the destination file exists and is up-to-date
-            if os.path.exists(dest_path):
-                src_mtime = os.path.getmtime(src_path)
-                dest_mtime = os.path.getmtime(dest_path)
-                if src_mtime <= dest_mtime:
-                    continue
+@functools.lru_cache(maxsize=1024)
+def _notebook_hash(notebook_path: str) -> str:
+    return hashlib.blake2b(notebook_path.encode(), digest_size=8).hexdigest()
 
-            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
-            shutil.copy2(src_path, dest_path)
 
-    # Remove cached files that are no longer in the source folder
-    for root, _, files in os.walk(to_path):
-        for file in files:
-            cached_path = os.path.join(root, file)
-            if cached_path not in source_files:
-                os.remove(cached_path)
+def _file_digest(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "blake2b").hexdigest()
 
 
 def build_notebook(config: Config, name: str) -> str:
     """Build notebook script and cache it"""
     notebook_path = os.path.join(config.notebooks_path, f"{name}.ipynb")
-    notebook_hash = hashlib.md5(notebook_path.encode()).hexdigest()
-    script_dir = os.path.join(config.cache_path, notebook_hash)
+    script_dir = os.path.join(config.cache_path, _notebook_hash(notebook_path))
     script_path = os.path.join(script_dir, f"{name}.py")
 
-    if not os.path.exists(notebook_path):
+    notebook_mtime = _mtime_ns(notebook_path)
+    if not notebook_mtime:
         print(f"Notebook not found: {notebook_path}")
         sys.exit(2)
 
-    notebook_mtime = os.path.getmtime(notebook_path)
-    script_mtime = os.path.getmtime(script_path) if os.path.exists(script_path) else 0
+    script_mtime = _mtime_ns(script_path)
 
     # If notebook is newer than script, or script doesn't exist
     if notebook_mtime > script_mtime:
         # Sync Python files from notebooks folder to cache
-        sync_python_files(config.notebooks_path, script_dir)
-        # Transform notebook to script
-        if not transform_notebook(config, name, notebook_path, script_path):
-            print(f"Error transforming notebook: {notebook_path}")
-            sys.exit(3)
+        sync_python_files(config.notebooks_path, script_dir, script_path)
+
+        # Editors may touch the notebook without changing it, so compare content
+        # hash with the one the script was built from before transforming again
+        digest_path = script_dir + ".hash"
+        notebook_digest = _file_digest(notebook_path)
+        try:
+            with open(digest_path, "r") as f:
+                unchanged = bool(script_mtime) and f.read() == notebook_digest
+        except FileNotFoundError:
+            unchanged = False
+
+        if unchanged:
+            try:
+                os.utime(script_path, ns=(notebook_mtime, notebook_mtime))
+            except FileNotFoundError:
+                unchanged = False
+
+        if not unchanged:
+            # Transform notebook to script
+            if not transform_notebook(config, name, notebook_path, script_path):
+                print(f"Error transforming notebook: {notebook_path}")
+                sys.exit(3)
+            with open(digest_path, "w") as f:
+                f.write(notebook_digest)
+
+    write_run_cache(config, name, notebook_path, script_path)
 
     return script_path
 
 
-def run_notebook(config: Config, name: str, args: list[str]) -> None:
-    script_path = build_notebook(config, name)
+def get_run_cache_path(cache_path: str, name: str) -> str:
+    name_hash = hashlib.blake2b(name.encode(), digest_size=8).hexdigest()
+    return os.path.join(cache_path, f"{name_hash}.json")
+
+
+def write_run_cache(
+    config: Config, name: str, notebook_path: str, script_path: str
+) -> None:
+    """Save resolved config and script path to run notebook without loading config"""
+    run_cache = {
+        "config": asdict(config),
+        "notebook_path": notebook_path,
+        "script_path": script_path,
+    }
+
+    with open(get_run_cache_path(config.cache_path, name), "w") as f:
+        json.dump(run_cache, f)
+
+
+def read_run_cache(
+    config_path: str, cache_path: str, name: str
+) -> tuple[Config, str] | None:
+    """Load saved config and script path, None if config or notebook changed since"""
+    try:
+        with open(get_run_cache_path(cache_path, name), "r") as f:
+            # Config file was modified after the run cache was written
+            if os.stat(config_path).st_mtime_ns >= os.fstat(f.fileno()).st_mtime_ns:
+                return None
+
+            run_cache = json.load(f)
+
+        notebook_mtime = os.stat(run_cache["notebook_path"]).st_mtime_ns
+        script_mtime = os.stat(run_cache["script_path"]).st_mtime_ns
+        if notebook_mtime > script_mtime:
+            return None
+
+        return Config(**run_cache["config"]), run_cache["script_path"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def run_script(config: Config, name: str, script_path: str, args: list[str]) -> None:
     interpreter_path = get_interpreter_path(config, name)
 
     os.execv(interpreter_path, [os.path.basename(interpreter_path), script_path] + args)
 
 
+def run_notebook(config: Config, name: str, args: list[str]) -> None:
+    script_path = build_notebook(config, name)
+    run_script(config, name, script_path, args)
+
+
 def show_usage():
     print(f"Usage: {os.path.basename(sys.argv[0])} NOTEBOOK_NAME [ARGS]")
     print("Run a Jupyter notebook from the command line")
@@ -261,7 +607,15 @@ def main():
         show_usage()
         sys.exit(0)
 
-    config_path = os.path.expanduser("~/.nb/config.toml")
+    config_path = os.path.join(NB_PATH, "config.toml")
+    name = sys.argv[1]
+    args = sys.argv[2:]
+
+    # Skip loading configuration if nothing changed since the last run
+    run_cache = read_run_cache(config_path, Config.cache_path, name)
+    if run_cache is not None:
+        config, script_path = run_cache
+        run_script(config, name, script_path, args)
 
     if not os.path.exists(config_path):
         print(f"Configuration file not found: {config_path}")
@@ -275,8 +629,6 @@ def main():
     os.makedirs(config.cache_path, exist_ok=True)
 
     # Run notebook
-    name = sys.argv[1]
-    args = sys.argv[2:]
     run_notebook(config, name, args)
 
 
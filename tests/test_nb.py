@@ -1,6 +1,8 @@
+import dataclasses
+import errno
 import json
 import os
-import shutil
+import subprocess
 import sys
 import tempfile
 import unittest
@@ -11,6 +13,56 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")
 
 import nb
 
+ASSETS_PATH = os.path.join(os.path.dirname(__file__), "assets")
+
+# Paths are filled in per test with dataclasses.replace
+BASE_CONFIG = nb.Config(
+    notebooks_path="",
+    jupyter_path="/usr/bin/jupyter",
+    ipython_path="/usr/bin/ipython",
+)
+
+CONFIG_TOML = """[default]
+notebooks_path = "{notebooks_path}"
+jupyter_path = "/usr/local/bin/jupyter"
+ipython_path = "/usr/local/bin/ipython"
+"""
+
+SCRIPT_WITH_MARKERS = """
+# Initial comment
+print("This will be ignored")
+
+# nb.start
+# ipython_path = "/custom/ipython"
+# another_config = "value"
+print("This is inside the markers")
+print("More code inside markers")
+# nb.end
+
+print("This will be ignored too")
+"""
+
+SCRIPT_WITH_NESTED_MARKERS = """
+# nb.start
+print("First block")
+# nb.start
+print("Nested block")
+# nb.end
+"""
+
+
+class TempDirTestCase(unittest.TestCase):
+    """Test case with a fresh directory per test inside one shared by the class"""
+
+    @classmethod
+    def setUpClass(cls):
+        root = tempfile.TemporaryDirectory(ignore_cleanup_errors=True)
+        cls.addClassCleanup(root.cleanup)
+        cls.root = root.name
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(dir=self.root)
+
 
 class TestConfig(unittest.TestCase):
     def test_config_from_dict_valid(self):
@@ -36,45 +88,49 @@ class TestConfig(unittest.TestCase):
 
 
 class TestLoadConfig(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.config_path = os.path.join(temp_dir.name, "config.toml")
+
     def test_load_config(self):
-        with tempfile.NamedTemporaryFile(mode="w", delete=False) as temp_file:
-            temp_file.write("""[default]
-notebooks_path = "~/test_notebooks"
-jupyter_path = "/usr/local/bin/jupyter"
-ipython_path = "/usr/local/bin/ipython"
-""")
+        with open(self.config_path, "w") as f:
+            f.write(CONFIG_TOML.format(notebooks_path="~/test_notebooks"))
+
+        config = nb.load_config(self.config_path)
+        self.assertEqual(config.notebooks_path, os.path.expanduser("~/test_notebooks"))
+        self.assertEqual(config.jupyter_path, "/usr/local/bin/jupyter")
+        self.assertEqual(config.ipython_path, "/usr/local/bin/ipython")
+
+    def test_load_config_modified(self):
+        with open(self.config_path, "w") as f:
+            f.write(CONFIG_TOML.format(notebooks_path="/old/notebooks"))
+        os.utime(self.config_path, (0, 0))
+        self.assertEqual(
+            nb.load_config(self.config_path).notebooks_path, "/old/notebooks"
+        )
 
-        try:
-            config = nb.load_config(temp_file.name)
-            self.assertEqual(
-                config.notebooks_path, os.path.expanduser("~/test_notebooks")
-            )
-            self.assertEqual(config.jupyter_path, "/usr/local/bin/jupyter")
-            self.assertEqual(config.ipython_path, "/usr/local/bin/ipython")
-        finally:
-            os.unlink(temp_file.name)
+        with open(self.config_path, "w") as f:
+            f.write(CONFIG_TOML.format(notebooks_path="/new/notebooks"))
+        self.assertEqual(
+            nb.load_config(self.config_path).notebooks_path, "/new/notebooks"
+        )
 
     def test_load_config_invalid(self):
-        with tempfile.NamedTemporaryFile(mode="w", delete=False) as temp_file:
-            temp_file.write("""[default]
+        with open(self.config_path, "w") as f:
+            f.write("""[default]
 # Missing required fields
 """)
 
-        try:
-            with self.assertRaises(SystemExit):
-                nb.load_config(temp_file.name)
-        finally:
-            os.unlink(temp_file.name)
+        with self.assertRaises(SystemExit):
+            nb.load_config(self.config_path)
 
 
-class TestLockFile(unittest.TestCase):
+class TestLockFile(TempDirTestCase):
     def setUp(self):
-        self.temp_dir = tempfile.mkdtemp()
+        super().setUp()
         self.lock_path = os.path.join(self.temp_dir, "test.lock")
 
-    def tearDown(self):
-        shutil.rmtree(self.temp_dir)
-
     @mock.patch("fcntl.flock")
     def test_lock_file(self, mock_flock):
         with nb.lock_file(self.lock_path):
@@ -86,22 +142,66 @@ class TestLockFile(unittest.TestCase):
         # Check if directory was created
         self.assertTrue(os.path.exists(os.path.dirname(self.lock_path)))
 
+    @mock.patch("fcntl.flock")
+    def test_lock_file_reuses_descriptor(self, mock_flock):
+        with nb.lock_file(self.lock_path):
+            pass
+        with nb.lock_file(self.lock_path):
+            pass
+
+        # Same descriptor is locked every time
+        fds = {call.args[0] for call in mock_flock.call_args_list}
+        self.assertEqual(len(fds), 1)
+
+    @mock.patch("fcntl.flock")
+    def test_lock_file_without_flock_support(self, mock_flock):
+        mock_flock.side_effect = OSError(errno.ENOLCK, "No locks available")
+        exclusive_path = f"{self.lock_path}.excl"
+
+        with nb.lock_file(self.lock_path):
+            self.assertTrue(os.path.exists(exclusive_path))
+
+        self.assertFalse(os.path.exists(exclusive_path))
 
-class TestInterpreterPaths(unittest.TestCase):
+    def test_exclusive_lock_file_stale(self):
+        exclusive_path = f"{self.lock_path}.excl"
+
+        # Lock file left over from a crashed process
+        with open(exclusive_path, "w"):
+            pass
+        os.utime(exclusive_path, (0, 0))
+
+        with nb.exclusive_lock_file(exclusive_path):
+            self.assertTrue(os.path.exists(exclusive_path))
+
+        self.assertFalse(os.path.exists(exclusive_path))
+
+    def test_exclusive_lock_file_taken_over(self):
+        exclusive_path = f"{self.lock_path}.excl"
+
+        with nb.exclusive_lock_file(exclusive_path):
+            # Another process took the lock over as stale and created its own
+            os.unlink(exclusive_path)
+            with open(exclusive_path, "w"):
+                pass
+            other_inode = os.stat(exclusive_path).st_ino
+
+        # Lock of the other process is kept
+        self.assertEqual(os.stat(exclusive_path).st_ino, other_inode)
+        self.assertEqual(os.listdir(self.temp_dir), ["test.lock.excl"])
+
+
+class TestInterpreterPaths(TempDirTestCase):
     def setUp(self):
-        self.temp_dir = tempfile.mkdtemp()
-        self.config = nb.Config(
+        super().setUp()
+        self.config = dataclasses.replace(
+            BASE_CONFIG,
             notebooks_path=os.path.join(self.temp_dir, "notebooks"),
-            jupyter_path="/usr/bin/jupyter",
-            ipython_path="/usr/bin/ipython",
             cache_path=os.path.join(self.temp_dir, "cache"),
             lock_file_path=os.path.join(self.temp_dir, "lock"),
             interpreters_mapping_path=os.path.join(self.temp_dir, "interpreters.json"),
         )
 
-    def tearDown(self):
-        shutil.rmtree(self.temp_dir)
-
     def test_get_interpreter_path_default(self):
         # When mapping doesn't exist, should return default ipython_path
         path = nb.get_interpreter_path(self.config, "test_notebook")
@@ -147,14 +247,55 @@ class TestInterpreterPaths(unittest.TestCase):
             self.assertEqual(updated_mapping["test_notebook"], "/updated/ipython")
             self.assertEqual(updated_mapping["other_notebook"], "/other/ipython")
 
+    def test_interpreters_mapping_multiple_updates(self):
+        with nb.interpreters_mapping(self.config) as mapping:
+            mapping["first_notebook"] = "/first/ipython"
+            mapping["second_notebook"] = "/second/ipython"
+
+        with open(self.config.interpreters_mapping_path, "r") as f:
+            self.assertEqual(
+                json.load(f),
+                {
+                    "first_notebook": "/first/ipython",
+                    "second_notebook": "/second/ipython",
+                },
+            )
+
+    def test_interpreters_mapping_not_written_on_error(self):
+        with self.assertRaises(RuntimeError):
+            with nb.interpreters_mapping(self.config) as mapping:
+                mapping["test_notebook"] = "/new/ipython"
+                raise RuntimeError
+
+        self.assertFalse(os.path.exists(self.config.interpreters_mapping_path))
+
+    def test_get_interpreter_path_after_external_change(self):
+        nb.set_interpreter_path(self.config, "test_notebook", "/old/ipython")
+        self.assertEqual(
+            nb.get_interpreter_path(self.config, "test_notebook"), "/old/ipython"
+        )
 
-class TestTransformNotebook(unittest.TestCase):
+        # Mapping atomically replaced by another process with a same size mapping,
+        # within the same timestamp tick of a filesystem with coarse timestamps
+        stat = os.stat(self.config.interpreters_mapping_path)
+        temp_path = os.path.join(self.temp_dir, "interpreters.json.new")
+        with open(temp_path, "w") as f:
+            json.dump({"test_notebook": "/new/ipython"}, f)
+        os.utime(temp_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        os.replace(temp_path, self.config.interpreters_mapping_path)
+
+        self.assertEqual(
+            nb.get_interpreter_path(self.config, "test_notebook"), "/new/ipython"
+        )
+
+
+class TestTransformNotebook(TempDirTestCase):
     def setUp(self):
-        self.temp_dir = tempfile.mkdtemp()
-        self.config = nb.Config(
+        super().setUp()
+        self.config = dataclasses.replace(
+            BASE_CONFIG,
             notebooks_path=os.path.join(self.temp_dir, "notebooks"),
-            jupyter_path="jupyter",  # Using just the name as we'll mock the os.system call
-            ipython_path="/usr/bin/ipython",
+            jupyter_path="jupyter",  # Using just the name as we'll mock the subprocess.run call
             cache_path=os.path.join(self.temp_dir, "cache"),
             lock_file_path=os.path.join(self.temp_dir, "lock"),
             interpreters_mapping_path=os.path.join(self.temp_dir, "interpreters.json"),
@@ -162,34 +303,18 @@ class TestTransformNotebook(unittest.TestCase):
         os.makedirs(self.config.notebooks_path, exist_ok=True)
         os.makedirs(self.config.cache_path, exist_ok=True)
 
-    def tearDown(self):
-        shutil.rmtree(self.temp_dir)
-
-    @mock.patch("os.system")
+    @mock.patch("subprocess.run")
     @mock.patch("nb.set_interpreter_path")
-    def test_transform_notebook_with_markers(self, mock_set_interpreter, mock_system):
+    def test_transform_notebook_with_markers(self, mock_set_interpreter, mock_run):
         notebook_path = os.path.join(self.config.notebooks_path, "test_notebook.ipynb")
         script_path = os.path.join(self.config.cache_path, "test_notebook.py")
 
-        # Mock os.system to create a fake converted .py file
-        def fake_convert(cmd):
-            temp_script_path = cmd.split("--output ")[1].split()[0] + ".py"
-            with open(temp_script_path, "w") as f:
-                f.write("""
-# Some initial comments
-print("This will be ignored")
-
-# nb.start
-# ipython_path = "/custom/ipython"
-print("This is inside the markers")
-print("More code inside markers")
-# nb.end
-
-print("This will be ignored too")
-""")
-            return 0
-
-        mock_system.side_effect = fake_convert
+        # Mock subprocess.run to return a fake converted script
+        mock_run.return_value = subprocess.CompletedProcess(
+            args=[],
+            returncode=0,
+            stdout=SCRIPT_WITH_MARKERS.encode(),
+        )
 
         result = nb.transform_notebook(
             self.config, "test_notebook", notebook_path, script_path
@@ -211,23 +336,21 @@ print("This will be ignored too")
             self.config, "test_notebook", "/custom/ipython"
         )
 
-    @mock.patch("os.system")
-    def test_transform_notebook_no_markers(self, mock_system):
+    @mock.patch("subprocess.run")
+    def test_transform_notebook_no_markers(self, mock_run):
         notebook_path = os.path.join(self.config.notebooks_path, "test_notebook.ipynb")
         script_path = os.path.join(self.config.cache_path, "test_notebook.py")
 
-        # Mock os.system to create a fake converted .py file
-        def fake_convert(cmd):
-            temp_script_path = cmd.split("--output ")[1].split()[0] + ".py"
-            with open(temp_script_path, "w") as f:
-                f.write("""
+        # Mock subprocess.run to return a fake converted script
+        mock_run.return_value = subprocess.CompletedProcess(
+            args=[],
+            returncode=0,
+            stdout=b"""
 # Some initial comments
 print("This will be included")
 print("All code is included as there are no markers")
-""")
-            return 0
-
-        mock_system.side_effect = fake_convert
+""",
+        )
 
         result = nb.transform_notebook(
             self.config, "test_notebook", notebook_path, script_path
@@ -242,51 +365,118 @@ print("All code is included as there are no markers")
             self.assertIn("This will be included", content)
             self.assertIn("All code is included as there are no markers", content)
 
-    @mock.patch("os.system")
-    def test_transform_notebook_invalid_markers(self, mock_system):
+    @mock.patch("subprocess.run")
+    def test_transform_notebook_invalid_markers(self, mock_run):
         notebook_path = os.path.join(self.config.notebooks_path, "test_notebook.ipynb")
         script_path = os.path.join(self.config.cache_path, "test_notebook.py")
 
-        # Mock os.system to create a fake converted .py file with invalid marker usage
-        def fake_convert(cmd):
-            temp_script_path = cmd.split("--output ")[1].split()[0] + ".py"
-            with open(temp_script_path, "w") as f:
-                f.write("""
-# nb.start
-print("First marker")
-# nb.start
-print("Nested start marker - should raise error")
-# nb.end
-""")
-            return 0
-
-        mock_system.side_effect = fake_convert
+        # Mock subprocess.run to return a fake converted script with invalid marker usage
+        mock_run.return_value = subprocess.CompletedProcess(
+            args=[],
+            returncode=0,
+            stdout=SCRIPT_WITH_NESTED_MARKERS.encode(),
+        )
 
         with self.assertRaises(ValueError):
             nb.transform_notebook(
                 self.config, "test_notebook", notebook_path, script_path
             )
 
+    @mock.patch("subprocess.run")
+    @mock.patch("nb.set_interpreter_path")
+    def test_transform_notebook_in_process(self, mock_set_interpreter, mock_run):
+        notebook_path = os.path.join(ASSETS_PATH, "test_with_markers.ipynb")
+        script_path = os.path.join(self.config.cache_path, "test_with_markers.py")
+
+        result = nb.transform_notebook(
+            self.config, "test_with_markers", notebook_path, script_path
+        )
+
+        self.assertTrue(result)
+        # Plain Python notebooks are converted without calling nbconvert
+        mock_run.assert_not_called()
+
+        with open(script_path, "r") as f:
+            content = f.read()
+            self.assertIn('print("This should be included")', content)
+            self.assertIn("def test_function():", content)
+            self.assertNotIn("This should be ignored", content)
+            self.assertNotIn("outside the nb.start/nb.end markers", content)
+
+        mock_set_interpreter.assert_called_once_with(
+            self.config, "test_with_markers", "/custom/python/path"
+        )
+
+    @mock.patch("nb.set_interpreter_path")
+    def test_transform_notebook_keeps_linked_source(self, mock_set_interpreter):
+        notebook_path = os.path.join(ASSETS_PATH, "test_without_markers.ipynb")
+        source_path = os.path.join(self.config.notebooks_path, "test.py")
+        script_path = os.path.join(self.config.cache_path, "test.py")
+
+        # Python file with the notebook name was linked into the cache
+        with open(source_path, "w") as f:
+            f.write("print('source')")
+        os.link(source_path, script_path)
+
+        nb.transform_notebook(self.config, "test", notebook_path, script_path)
+
+        with open(source_path, "r") as f:
+            self.assertEqual(f.read(), "print('source')")
+        with open(script_path, "r") as f:
+            self.assertIn("calculate_factorial", f.read())
+
+    def write_notebook(self, notebook):
+        notebook_path = os.path.join(self.config.notebooks_path, "test.ipynb")
+        with open(notebook_path, "w") as f:
+            json.dump(notebook, f)
+        return notebook_path
+
+    def test_read_notebook_source_magics(self):
+        sources = [
+            "%matplotlib inline\n",
+            "!ls\n",
+            "x = %pwd\n",
+            "print?\n",
+            "?print\n",
+            "??len\n",
+            "/print 1\n",
+            ",print a b\n",
+            ";print a b\n",
+        ]
+        for source in sources:
+            with self.subTest(source=source):
+                notebook_path = self.write_notebook(
+                    {
+                        "cells": [{"cell_type": "code", "source": [source]}],
+                        "metadata": {"language_info": {"name": "python"}},
+                    }
+                )
+
+                # Notebooks with IPython syntax are left to nbconvert
+                self.assertIsNone(nb.read_notebook_source(notebook_path))
+
+    def test_read_notebook_source_unexpected_structure(self):
+        notebooks = [
+            [],
+            {"cells": [], "metadata": {"language_info": None}},
+            {"cells": [], "metadata": None},
+            {"cells": ["print(1)"]},
+            {"cells": [{"cell_type": "code", "source": 1}]},
+            {"cells": None},
+        ]
+        for notebook in notebooks:
+            with self.subTest(notebook=notebook):
+                notebook_path = self.write_notebook(notebook)
+
+                self.assertIsNone(nb.read_notebook_source(notebook_path))
+
 
 class TestParseFile(unittest.TestCase):
     """Tests for the parse_file function that extracts script content and config from notebook content."""
 
     def test_parse_file_with_markers_and_toml(self):
         """Test parsing a file with nb.start/nb.end markers and TOML config."""
-        content = """
-# Initial comment
-print("This will be ignored")
-
-# nb.start
-# ipython_path = "/custom/ipython"
-# another_config = "value"
-print("This is inside the markers")
-print("More code inside markers")
-# nb.end
-
-print("This will be ignored too")
-"""
-        script, config = nb.parse_file(content)
+        script, config = nb.parse_file(SCRIPT_WITH_MARKERS)
 
         # Check script content
         self.assertIn("This is inside the markers", script)
@@ -298,17 +488,35 @@ print("This will be ignored too")
         self.assertEqual(config["ipython_path"], "/custom/ipython")
         self.assertEqual(config["another_config"], "value")
 
-    def test_parse_file_with_markers_no_toml(self):
-        """Test parsing a file with nb.start/nb.end markers but no TOML config."""
-        content = """
+    def test_parse_file_without_toml(self):
+        """Test parsing files with nb.start/nb.end markers but no TOML config."""
+        cases = [
+            (
+                "no_toml",
+                """
 # nb.start
 print("Only code, no TOML config")
 # nb.end
-"""
-        script, config = nb.parse_file(content)
+""",
+                'print("Only code, no TOML config")',
+            ),
+            (
+                "empty_toml",
+                """
+# nb.start
 
-        self.assertEqual(script, 'print("Only code, no TOML config")')
-        self.assertEqual(config, {})
+print("Code after empty line")
+# nb.end
+""",
+                'print("Code after empty line")',
+            ),
+        ]
+        for case, content, expected_script in cases:
+            with self.subTest(case=case):
+                script, config = nb.parse_file(content)
+
+                self.assertEqual(script, expected_script)
+                self.assertEqual(config, {})
 
     def test_parse_file_no_markers(self):
         """Test parsing a file without any nb.start/nb.end markers."""
@@ -325,66 +533,44 @@ def test():
         self.assertIn("def test():", script)
         self.assertEqual(config, {})
 
-    def test_parse_file_with_empty_toml(self):
-        """Test parsing with markers but empty TOML section."""
-        content = """
-# nb.start
-
-print("Code after empty line")
-# nb.end
-"""
-        script, config = nb.parse_file(content)
-
-        self.assertEqual(script, 'print("Code after empty line")')
-        self.assertEqual(config, {})
-
-    def test_parse_file_with_nested_markers_error(self):
-        """Test that nested start markers raise a ValueError."""
-        content = """
-# nb.start
-print("First block")
-# nb.start
-print("Nested block")
-# nb.end
-"""
-        with self.assertRaises(ValueError):
-            nb.parse_file(content)
-
-    def test_parse_file_with_end_before_start_error(self):
-        """Test that end marker before start marker raises a ValueError."""
-        content = """
+    def test_parse_file_errors(self):
+        """Test that invalid markers and invalid TOML raise a ValueError."""
+        cases = [
+            ("nested_markers", SCRIPT_WITH_NESTED_MARKERS),
+            (
+                "end_before_start",
+                """
 print("Some code")
 # nb.end
 print("More code")
 # nb.start
 print("Too late")
-"""
-        with self.assertRaises(ValueError):
-            nb.parse_file(content)
-
-    def test_parse_file_with_multiple_end_markers_error(self):
-        """Test that multiple end markers raise a ValueError."""
-        content = """
+""",
+            ),
+            (
+                "multiple_end_markers",
+                """
 # nb.start
 print("In block")
 # nb.end
 print("Between blocks")
 # nb.end
-"""
-        with self.assertRaises(ValueError):
-            nb.parse_file(content)
-
-    def test_parse_file_with_invalid_toml(self):
-        """Test parsing with invalid TOML configuration."""
-        content = """
+""",
+            ),
+            (
+                "invalid_toml",
+                """
 # nb.start
 # this is not valid TOML
 # key = unclosed string value"
 print("Code after invalid TOML")
 # nb.end
-"""
-        with self.assertRaises(Exception):
-            nb.parse_file(content)
+""",
+            ),
+        ]
+        for case, content in cases:
+            with self.subTest(case=case), self.assertRaises(ValueError):
+                nb.parse_file(content)
 
     def test_parse_file_toml_and_code_mixed(self):
         """Test parsing when TOML and code are mixed."""
@@ -405,18 +591,17 @@ print("More code")
         self.assertIn('print("More code")', script)
 
 
-class TestCachePythonFiles(unittest.TestCase):
+class TestCachePythonFiles(TempDirTestCase):
     def setUp(self):
-        self.temp_dir = tempfile.mkdtemp()
+        super().setUp()
         self.notebooks_path = os.path.join(self.temp_dir, "notebooks")
         self.cache_path = os.path.join(self.temp_dir, "cache")
         os.makedirs(self.notebooks_path, exist_ok=True)
         os.makedirs(self.cache_path, exist_ok=True)
 
-        self.config = nb.Config(
+        self.config = dataclasses.replace(
+            BASE_CONFIG,
             notebooks_path=self.notebooks_path,
-            jupyter_path="/usr/bin/jupyter",
-            ipython_path="/usr/bin/ipython",
             cache_path=self.cache_path,
             lock_file_path=os.path.join(self.temp_dir, "lock"),
             interpreters_mapping_path=os.path.join(self.temp_dir, "interpreters.json"),
@@ -424,15 +609,8 @@ class TestCachePythonFiles(unittest.TestCase):
 
         # Create some test files
         self.py_file_path = os.path.join(self.notebooks_path, "test.py")
-        self.ipynb_file_path = os.path.join(self.notebooks_path, "test.ipynb")
-        self.txt_file_path = os.path.join(self.notebooks_path, "test.txt")
-
         with open(self.py_file_path, "w") as f:
             f.write("print('hello')")
-        with open(self.ipynb_file_path, "w") as f:
-            f.write("{}")  # Empty notebook
-        with open(self.txt_file_path, "w") as f:
-            f.write("text file")
 
         # Create subdirectory with files
         self.sub_dir = os.path.join(self.notebooks_path, "subdir")
@@ -441,122 +619,306 @@ class TestCachePythonFiles(unittest.TestCase):
         with open(self.sub_py_file, "w") as f:
             f.write("print('subdir')")
 
-    def tearDown(self):
-        shutil.rmtree(self.temp_dir)
-
     def test_cache_python_files(self):
         # Call sync_python_files with from_path and to_path arguments
         nb.sync_python_files(self.notebooks_path, self.cache_path)
 
         # Check that Python files were cached
-        self.assertTrue(os.path.exists(os.path.join(self.cache_path, "test.py")))
-        # Notebooks (.ipynb files) should not be copied by sync_python_files
-        self.assertFalse(os.path.exists(os.path.join(self.cache_path, "test.ipynb")))
+        with os.scandir(self.cache_path) as it:
+            self.assertEqual({entry.name for entry in it}, {"test.py", "subdir"})
+        with os.scandir(os.path.join(self.cache_path, "subdir")) as it:
+            self.assertEqual({entry.name for entry in it}, {"sub.py"})
+
+    def test_cache_ignores_non_py(self):
+        with open(os.path.join(self.notebooks_path, "test.ipynb"), "w") as f:
+            f.write("{}")  # Empty notebook
+        with open(os.path.join(self.notebooks_path, "test.txt"), "w") as f:
+            f.write("text file")
+
+        nb.sync_python_files(self.notebooks_path, self.cache_path)
+
+        # Notebooks and other files should not be cached
+        with os.scandir(self.cache_path) as it:
+            self.assertEqual({entry.name for entry in it}, {"test.py", "subdir"})
+
+    def test_cache_python_files_hard_links(self):
+        nb.sync_python_files(self.notebooks_path, self.cache_path)
+
+        # Cache and notebooks folder are on the same filesystem
         self.assertTrue(
+            os.path.samefile(
+                self.py_file_path, os.path.join(self.cache_path, "test.py")
+            )
+        )
+
+    def test_cache_python_files_removes_deleted(self):
+        nb.sync_python_files(self.notebooks_path, self.cache_path)
+        os.remove(self.sub_py_file)
+        nb.sync_python_files(self.notebooks_path, self.cache_path)
+
+        self.assertTrue(os.path.exists(os.path.join(self.cache_path, "test.py")))
+        self.assertFalse(
+            os.path.exists(os.path.join(self.cache_path, "subdir", "sub.py"))
+        )
+
+    def test_cache_python_files_removes_deleted_same_tick(self):
+        nb.sync_python_files(self.notebooks_path, self.cache_path)
+
+        # Filesystem with coarse timestamps keeps directory mtime after deletion
+        sub_dir_stat = os.stat(self.sub_dir)
+        os.remove(self.sub_py_file)
+        os.utime(self.sub_dir, ns=(sub_dir_stat.st_atime_ns, sub_dir_stat.st_mtime_ns))
+
+        nb.sync_python_files(self.notebooks_path, self.cache_path)
+
+        self.assertFalse(
             os.path.exists(os.path.join(self.cache_path, "subdir", "sub.py"))
         )
 
-        # Text file should not be cached
-        self.assertFalse(os.path.exists(os.path.join(self.cache_path, "test.txt")))
+    def test_cache_python_files_replaced_source(self):
+        nb.sync_python_files(self.notebooks_path, self.cache_path)
+
+        # Editor saves by writing a new file and renaming it over the source
+        temp_path = os.path.join(self.temp_dir, "test.py")
+        with open(temp_path, "w") as f:
+            f.write("print('updated')")
+        os.utime(temp_path, (os.path.getmtime(self.py_file_path) + 10,) * 2)
+        os.replace(temp_path, self.py_file_path)
+        # Temporary file of a concurrent run is left alone
+        concurrent_temp_path = os.path.join(self.cache_path, "test.py.1.tmp")
+        with open(concurrent_temp_path, "w") as f:
+            f.write("print('hello')")
+
+        nb.sync_python_files(self.notebooks_path, self.cache_path)
+
+        with open(os.path.join(self.cache_path, "test.py"), "r") as f:
+            self.assertEqual(f.read(), "print('updated')")
+        self.assertTrue(os.path.exists(concurrent_temp_path))
 
 
-class TestBuildNotebook(unittest.TestCase):
+class TestBuildNotebook(TempDirTestCase):
     def setUp(self):
-        self.temp_dir = tempfile.mkdtemp()
+        super().setUp()
         self.notebooks_path = os.path.join(self.temp_dir, "notebooks")
         self.cache_path = os.path.join(self.temp_dir, "cache")
         os.makedirs(self.notebooks_path, exist_ok=True)
         os.makedirs(self.cache_path, exist_ok=True)
 
-        self.config = nb.Config(
+        self.config = dataclasses.replace(
+            BASE_CONFIG,
             notebooks_path=self.notebooks_path,
-            jupyter_path="/usr/bin/jupyter",
-            ipython_path="/usr/bin/ipython",
             cache_path=self.cache_path,
             lock_file_path=os.path.join(self.temp_dir, "lock"),
             interpreters_mapping_path=os.path.join(self.temp_dir, "interpreters.json"),
         )
 
-    def tearDown(self):
-        shutil.rmtree(self.temp_dir)
+        # Modification times seen by build_notebook, missing paths don't exist
+        self.mtimes = {}
+        self.start_patch(
+            "nb._mtime_ns", side_effect=lambda path: self.mtimes.get(path, 0)
+        )
+
+        # Conversion itself is covered by TestTransformNotebook and TestCachePythonFiles
+        self.mock_transform = self.start_patch(
+            "nb.transform_notebook", return_value=True
+        )
+        self.sync_python_files = nb.sync_python_files
+        self.mock_sync = self.start_patch("nb.sync_python_files")
+
+    def start_patch(self, target, **kwargs):
+        patcher = mock.patch(target, **kwargs)
+        self.addCleanup(patcher.stop)
+        return patcher.start()
+
+    def build_twice(self, change_sources):
+        """Build notebook with real syncing, then touch it without changing content"""
+        notebook_path = os.path.join(self.notebooks_path, "test.ipynb")
+        with open(notebook_path, "w") as f:
+            f.write("{}")
+
+        def transform(config, name, notebook_path, script_path):
+            with open(script_path, "w") as f:
+                f.write("print('script')")
+            return True
 
-    @mock.patch("nb.transform_notebook")
-    @mock.patch("nb.sync_python_files")
-    def test_build_notebook_existing(self, mock_sync, mock_transform):
+        self.mock_sync.side_effect = self.sync_python_files
+        self.mock_transform.side_effect = transform
+
+        self.mtimes[notebook_path] = 1
+        script_path = nb.build_notebook(self.config, "test")
+
+        change_sources()
+        self.mtimes[notebook_path] = 3
+        self.mtimes[script_path] = 2
+        self.assertEqual(nb.build_notebook(self.config, "test"), script_path)
+
+        self.mock_transform.assert_called_once()
+        with open(script_path, "r") as f:
+            self.assertEqual(f.read(), "print('script')")
+        return script_path
+
+    def test_build_notebook_existing(self):
         # Create notebook file
         notebook_path = os.path.join(self.notebooks_path, "test.ipynb")
         with open(notebook_path, "w") as f:
             f.write("{}")  # Empty notebook
 
         # Create cached script
-        notebook_hash = nb.hashlib.md5(notebook_path.encode()).hexdigest()
-        script_dir = os.path.join(self.cache_path, notebook_hash)
+        script_dir = os.path.join(self.cache_path, nb._notebook_hash(notebook_path))
         os.makedirs(script_dir, exist_ok=True)
         script_path = os.path.join(script_dir, "test.py")
         with open(script_path, "w") as f:
             f.write("print('cached')")
 
-        # Set up mock to indicate successful transform
-        mock_transform.return_value = True
-
         # Make notebook file newer than cached script
-        os.utime(
-            notebook_path,
-            (os.path.getmtime(script_path) + 10, os.path.getmtime(script_path) + 10),
-        )
+        self.mtimes[notebook_path] = 2
+        self.mtimes[script_path] = 1
 
         result_path = nb.build_notebook(self.config, "test")
 
         self.assertEqual(result_path, script_path)
-        mock_transform.assert_called_once()
-        mock_sync.assert_called_once_with(self.config.notebooks_path, script_dir)
+        self.mock_transform.assert_called_once()
+        self.mock_sync.assert_called_once_with(
+            self.config.notebooks_path, script_dir, script_path
+        )
 
-    @mock.patch("nb.transform_notebook")
-    @mock.patch("nb.sync_python_files")
-    def test_build_notebook_up_to_date(self, mock_sync, mock_transform):
+    def test_build_notebook_up_to_date(self):
         # Create notebook file
         notebook_path = os.path.join(self.notebooks_path, "test.ipynb")
         with open(notebook_path, "w") as f:
             f.write("{}")  # Empty notebook
 
         # Create cached script
-        notebook_hash = nb.hashlib.md5(notebook_path.encode()).hexdigest()
-        script_dir = os.path.join(self.cache_path, notebook_hash)
+        script_dir = os.path.join(self.cache_path, nb._notebook_hash(notebook_path))
         os.makedirs(script_dir, exist_ok=True)
         script_path = os.path.join(script_dir, "test.py")
         with open(script_path, "w") as f:
             f.write("print('cached')")
 
         # Make cached script newer than notebook file
-        os.utime(
-            script_path,
-            (
-                os.path.getmtime(notebook_path) + 10,
-                os.path.getmtime(notebook_path) + 10,
-            ),
-        )
+        self.mtimes[notebook_path] = 1
+        self.mtimes[script_path] = 2
 
         result_path = nb.build_notebook(self.config, "test")
 
         self.assertEqual(result_path, script_path)
         # Should not transform if cache is up to date
-        mock_transform.assert_not_called()
-        mock_sync.assert_not_called()
+        self.mock_transform.assert_not_called()
+        self.mock_sync.assert_not_called()
+
+    def test_build_notebook_content_unchanged(self):
+        notebook_path = os.path.join(self.notebooks_path, "test.ipynb")
+        with open(notebook_path, "w") as f:
+            f.write("{}")
+
+        script_dir = os.path.join(self.cache_path, nb._notebook_hash(notebook_path))
+        os.makedirs(script_dir, exist_ok=True)
+        script_path = os.path.join(script_dir, "test.py")
+        with open(script_path, "w") as f:
+            f.write("print('cached')")
+        with open(script_dir + ".hash", "w") as f:
+            f.write(nb._file_digest(notebook_path))
+
+        # Notebook is touched without changing its content
+        self.mtimes[notebook_path] = 2
+        self.mtimes[script_path] = 1
+
+        result_path = nb.build_notebook(self.config, "test")
+
+        self.assertEqual(result_path, script_path)
+        self.mock_transform.assert_not_called()
+        self.mock_sync.assert_called_once_with(
+            self.config.notebooks_path, script_dir, script_path
+        )
+        self.assertEqual(os.stat(script_path).st_mtime_ns, 2)
+
+    def test_build_notebook_content_unchanged_new_source(self):
+        helper_path = os.path.join(self.notebooks_path, "helper.py")
+
+        def add_helper():
+            with open(helper_path, "w") as f:
+                f.write("print('helper')")
+
+        script_path = self.build_twice(add_helper)
+
+        self.assertTrue(
+            os.path.exists(os.path.join(os.path.dirname(script_path), "helper.py"))
+        )
+
+    def test_build_notebook_content_unchanged_source_with_notebook_name(self):
+        source_path = os.path.join(self.notebooks_path, "test.py")
+
+        def add_source():
+            with open(source_path, "w") as f:
+                f.write("print('source')")
+            os.utime(source_path, ns=(0, 2**62))
+
+        script_path = self.build_twice(add_source)
+
+        # Source file is neither cached as the script nor touched
+        self.assertFalse(os.path.samefile(source_path, script_path))
+        self.assertEqual(os.stat(source_path).st_mtime_ns, 2**62)
 
     def test_build_notebook_not_found(self):
         with self.assertRaises(SystemExit):
             nb.build_notebook(self.config, "nonexistent")
 
 
+class TestRunCache(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.config_path = os.path.join(self.temp_dir, "config.toml")
+        self.notebook_path = os.path.join(self.temp_dir, "test.ipynb")
+        self.script_path = os.path.join(self.temp_dir, "test.py")
+
+        self.config = dataclasses.replace(
+            BASE_CONFIG,
+            notebooks_path=self.temp_dir,
+            cache_path=self.temp_dir,
+            lock_file_path=os.path.join(self.temp_dir, "lock"),
+            interpreters_mapping_path=os.path.join(self.temp_dir, "interpreters.json"),
+        )
+
+        for path in (self.config_path, self.notebook_path, self.script_path):
+            with open(path, "w") as f:
+                f.write("")
+
+        # Make config and notebook older than cached script
+        os.utime(self.config_path, (0, 0))
+        os.utime(self.notebook_path, (0, 0))
+
+        nb.write_run_cache(self.config, "test", self.notebook_path, self.script_path)
+
+    def test_read_run_cache_fresh(self):
+        run_cache = nb.read_run_cache(self.config_path, self.temp_dir, "test")
+        self.assertEqual(run_cache, (self.config, self.script_path))
+
+    def test_read_run_cache_notebook_changed(self):
+        os.utime(self.notebook_path, None)
+        os.utime(self.script_path, (0, 0))
+        self.assertIsNone(nb.read_run_cache(self.config_path, self.temp_dir, "test"))
+
+    def test_read_run_cache_config_changed(self):
+        os.utime(self.config_path, (2**32, 2**32))
+        self.assertIsNone(nb.read_run_cache(self.config_path, self.temp_dir, "test"))
+
+    def test_read_run_cache_missing(self):
+        self.assertIsNone(nb.read_run_cache(self.config_path, self.temp_dir, "other"))
+
+
 class TestRunNotebook(unittest.TestCase):
-    @mock.patch("os.execv")
-    @mock.patch("nb.build_notebook")
-    @mock.patch("nb.get_interpreter_path")
-    def test_run_notebook(self, mock_get_interpreter, mock_build, mock_execv):
-        # Setup mocks
-        mock_build.return_value = "/path/to/script.py"
-        mock_get_interpreter.return_value = "/path/to/ipython"
+    def swap(self, obj, attr, value):
+        """Replace attribute for the duration of the test"""
+        self.addCleanup(setattr, obj, attr, getattr(obj, attr))
+        setattr(obj, attr, value)
+
+    def setUp(self):
+        self.execv_calls = []
+        self.swap(os, "execv", lambda *args: self.execv_calls.append(args))
+        self.swap(nb, "build_notebook", lambda config, name: "/path/to/script.py")
+        self.swap(nb, "get_interpreter_path", lambda config, name: "/path/to/ipython")
 
+    def test_run_notebook(self):
         config = nb.Config(
             notebooks_path="/path/to/notebooks",
             jupyter_path="/path/to/jupyter",
@@ -566,8 +928,9 @@ class TestRunNotebook(unittest.TestCase):
         nb.run_notebook(config, "test", ["arg1", "arg2"])
 
         # Check that execv was called with correct arguments
-        mock_execv.assert_called_once_with(
-            "/path/to/ipython", ["ipython", "/path/to/script.py", "arg1", "arg2"]
+        self.assertEqual(
+            self.execv_calls,
+            [("/path/to/ipython", ["ipython", "/path/to/script.py", "arg1", "arg2"])],
         )
 
 